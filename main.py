@@ -1,30 +1,133 @@
-import os, json, tempfile, subprocess, uuid
+import os, io, json, logging, collections, functools, itertools, math, queue, tempfile, subprocess, threading, time, uuid
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from fractions import Fraction
+from urllib.parse import quote
+
+import av
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 
 
 app = FastAPI()
+log = logging.getLogger(__name__)
 
 # ✅ FIXER Zielordner für Frames (dein Link)
 TARGET_FRAMES_FOLDER_ID = "1ph8Syb_mAvumkTlzjSypeyGpZ3oyuf9O"
 
+MAX_BATCH_CONCURRENCY = 10   # max Videos parallel im Batch
+UPLOAD_WORKERS = 8           # parallele Frame-Uploads pro Video
+
+# --------- Shared: eine HTTP-Session (Keep-Alive, TLS nur einmal pro Verbindung) ----------
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    # alle gleichzeitigen Verbindungen zu googleapis.com im vollen Batch:
+    # pro Video die Uploads + Download/Metadaten, sonst wirft urllib3 Verbindungen weg
+    pool_maxsize=MAX_BATCH_CONCURRENCY * (UPLOAD_WORKERS + 1),
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False,  # letzte Antwort durchreichen, Statuscodes prüfen wir selbst
+    ),
+))
+
 # --------- Shared: Cloud Run -> OAuth token via metadata server ----------
+_TOKEN_CACHE = {"tok": None, "exp": 0.0}
+_TOKEN_LOCK = threading.Lock()
+
 def _access_token():
-    r = requests.get(
-        "http://metadata.google.internal/computeMetadata/v1/instance/service-accounts/default/token",
-        headers={"Metadata-Flavor": "Google"},
-        timeout=10,
-    )
-    r.raise_for_status()
-    return r.json()["access_token"]
+    # Token cachen bis kurz vor Ablauf (expires_in ist typischerweise 3600s)
+    with _TOKEN_LOCK:
+        if _TOKEN_CACHE["tok"] and time.monotonic() < _TOKEN_CACHE["exp"] - 60:
+            return _TOKEN_CACHE["tok"]
+
+        r = SESSION.get(
+            "http://metadata.google.internal/computeMetadata/v1/instance/service-accounts/default/token",
+            headers={"Metadata-Flavor": "Google"},
+            timeout=10,
+        )
+        r.raise_for_status()
+        data = r.json()
+        _TOKEN_CACHE["tok"] = data["access_token"]
+        _TOKEN_CACHE["exp"] = time.monotonic() + float(data.get("expires_in", 0))
+        return _TOKEN_CACHE["tok"]
 
 def _auth_hdr(token: str):
     return {"Authorization": f"Bearer {token}"}
 
 
+def drive_batch(paths: list[str]) -> list[tuple[int, dict]]:
+    """
+    Schickt mehrere Drive-GETs (z.B. "/drive/v3/files/<id>?fields=...") in einem
+    einzigen HTTP-Call an den Batch-Endpoint (max 100 pro Batch).
+    Gibt [(status, json)] in derselben Reihenfolge wie paths zurück,
+    status 0 = keine Antwort für diesen Eintrag. IDs in paths müssen bereits
+    URL-encodet sein (landen roh in der HTTP-Zeile).
+    """
+    if not paths:
+        return []
+
+    token = _access_token()
+    boundary = "batch_" + uuid.uuid4().hex
+
+    body = "".join(
+        f"--{boundary}\r\n"
+        "Content-Type: application/http\r\n"
+        f"Content-ID: <item{i}>\r\n\r\n"
+        f"GET {path} HTTP/1.1\r\n\r\n"
+        for i, path in enumerate(paths)
+    ) + f"--{boundary}--\r\n"
+
+    r = SESSION.post(
+        "https://www.googleapis.com/batch/drive/v3",
+        headers={**_auth_hdr(token), "Content-Type": f"multipart/mixed; boundary={boundary}"},
+        data=body.encode("utf-8"),
+        timeout=60,
+    )
+    if r.status_code >= 300:
+        raise HTTPException(r.status_code, f"Drive batch failed: {r.text}")
+
+    content_type = r.headers.get("Content-Type", "")
+    if "boundary=" not in content_type:
+        raise HTTPException(502, f"Drive batch: unexpected response ({content_type or 'no Content-Type'})")
+    resp_boundary = content_type.split("boundary=")[-1].strip('"')
+    results = [(0, {})] * len(paths)
+
+    for part in r.text.split(f"--{resp_boundary}"):
+        if "Content-ID" not in part:
+            continue
+        # Part-Header | eingebettete HTTP-Antwort (Statuszeile + Header) | JSON-Body
+        part_headers, _, http_resp = part.strip().partition("\r\n\r\n")
+        status_line, _, rest = http_resp.partition("\r\n")
+        _, _, payload = rest.partition("\r\n\r\n")
+
+        # Kaputte Parts überspringen: der Eintrag bleibt auf status 0 und
+        # der Worker holt sich die Metadaten selbst
+        try:
+            idx = None
+            for line in part_headers.split("\r\n"):
+                if line.lower().startswith("content-id:"):
+                    idx = int(line.split("item", 1)[1].rstrip(">").strip())
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            continue
+        if idx is None or not 0 <= idx < len(paths):
+            continue
+
+        try:
+            data = json.loads(payload) if payload.strip() else {}
+        except ValueError:
+            data = {}
+        results[idx] = (status, data)
+
+    return results
+
+
 # ======================================================================
 # 1) COUNT MEDIA IN A DRIVE FOLDER
 # ======================================================================
@@ -45,7 +148,7 @@ def count_media(req: CountReq):
         "includeItemsFromAllDrives": "true",
     }
 
-    r = requests.get(url, headers=_auth_hdr(token), params=params, timeout=30)
+    r = SESSION.get(url, headers=_auth_hdr(token), params=params, timeout=30)
     if r.status_code >= 300:
         raise HTTPException(r.status_code, r.text)
 
@@ -80,19 +183,52 @@ class ExtractReq(BaseModel):
     frames: int = 20
     min_gap_sec: float = 2.0
     max_width: int = 640
+    exact: bool = False      # False = nur Keyframes: erster Keyframe bei/nach jedem Timestamp (viel schneller)
 
-def download_drive_video(file_id: str, out_path: str):
+def _open_drive_media(file_id: str):
     token = _access_token()
-    url = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media&supportsAllDrives=true"
+    url = f"https://www.googleapis.com/drive/v3/files/{quote(file_id, safe='')}?alt=media&supportsAllDrives=true"
 
-    with requests.get(url, headers=_auth_hdr(token), stream=True, timeout=300) as r:
-        if r.status_code == 404:
-            raise HTTPException(404, "Drive file not found (share file/folder with service account)")
+    r = SESSION.get(url, headers=_auth_hdr(token), stream=True, timeout=300)
+    if r.status_code == 404:
+        r.close()
+        raise HTTPException(404, "Drive file not found (share file/folder with service account)")
+    if r.status_code >= 300:
+        r.close()
         r.raise_for_status()
-        with open(out_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    f.write(chunk)
+    return r
+
+def _write_chunks(chunks, out_path: str):
+    with open(out_path, "wb") as f:
+        for chunk in chunks:
+            if chunk:
+                f.write(chunk)
+
+def download_drive_video(file_id: str, out_path: str):
+    with _open_drive_media(file_id) as r:
+        _write_chunks(r.iter_content(chunk_size=1024 * 1024), out_path)
+
+# Drive kennt die Dauer meist schon (videoMediaMetadata) -> spart den ffprobe-Prozess
+DRIVE_DURATION_FIELDS = "videoMediaMetadata(durationMillis)"
+
+def _meta_duration(meta: dict) -> float:
+    try:
+        return int((meta.get("videoMediaMetadata") or {}).get("durationMillis", 0)) / 1000.0
+    except (TypeError, ValueError):
+        return 0.0
+
+def drive_video_duration(file_id: str) -> float:
+    """
+    Dauer laut Drive-Metadaten, 0.0 wenn (noch) nicht verfügbar.
+    """
+    token = _access_token()
+    url = f"https://www.googleapis.com/drive/v3/files/{quote(file_id, safe='')}"
+    params = {"fields": DRIVE_DURATION_FIELDS, "supportsAllDrives": "true"}
+
+    r = SESSION.get(url, headers=_auth_hdr(token), params=params, timeout=30)
+    if r.status_code >= 300:
+        return 0.0
+    return _meta_duration(r.json())
 
 def probe_duration(video_path: str) -> float:
     p = subprocess.run(
@@ -105,40 +241,360 @@ def probe_duration(video_path: str) -> float:
     except:
         return 0.0
 
-def extract_frames(video_path: str, frames_dir: str, n: int, min_gap: float, max_width: int):
-    dur = probe_duration(video_path)
+# Ab diesem Abstand zwischen Frames ist Seeken pro Frame billiger als ein
+# linearer Decode-Durchlauf über die ganze Datei
+SINGLE_PASS_MAX_STEP_SEC = 30.0
+SEEK_WORKERS = 8   # max parallele Seek-Worker pro Video
 
-    if dur <= 0:
-        timestamps = [0.0]
-    else:
-        raw_step = dur / max(n, 1)
-        step = max(min_gap, raw_step)
-        timestamps, t = [], 0.0
-        while t < dur and len(timestamps) < n:
-            timestamps.append(t)
-            t += step
-        if not timestamps:
-            timestamps = [max(0.0, dur - 0.1)]
-
-    out_files = []
-    for i, t in enumerate(timestamps):
-        out = os.path.join(frames_dir, f"frame_{i:03d}.jpg")
-        vf = f"scale='min({max_width},iw)':-2"
-
-        subprocess.run(
+# JPEG-Qualität (mjpeg-qscale, wie ffmpeg -q:v) für beide Wege: ffmpeg-CLI und PyAV
+JPEG_QSCALE = 3
+
+# JPEGs gehen als MJPEG-Stream über stdout raus, nichts landet auf Platte
+_JPEG_PIPE_ARGS = ["-f", "image2pipe", "-vcodec", "mjpeg", "-q:v", str(JPEG_QSCALE), "pipe:1"]
+
+# Puffer für ffmpeg stdin/stdout: 1MB statt 8KB -> viel weniger read()/write()-Syscalls
+PIPE_BUFSIZE = 1 << 20
+
+@functools.lru_cache(maxsize=1)
+def _decode_args() -> tuple[str, ...]:
+    """
+    Input-Optionen fürs Decoding, einmalig ermittelt: CUDA-Decode wenn es
+    wirklich ein CUDA-Gerät gibt (Frames landen automatisch wieder im RAM,
+    scale/mjpeg laufen unverändert auf der CPU), sonst nur Auto-Threads.
+    """
+    if _has_cuda_device():
+        return ("-hwaccel", "cuda", "-threads", "0")
+    return ("-threads", "0")
+
+def _has_cuda_device() -> bool:
+    # "ffmpeg -hwaccels" listet nur, womit ffmpeg gebaut ist (Debian-ffmpeg
+    # zeigt cuda auch ohne GPU) -> zusätzlich ein Gerät tatsächlich öffnen
+    try:
+        p = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-hwaccels"],
+            capture_output=True, text=True, timeout=10
+        )
+        if "cuda" not in p.stdout.split():
+            return False
+        p = subprocess.run(
             ["ffmpeg", "-hide_banner", "-loglevel", "error",
-             "-ss", str(max(0.0, t)),
-             "-i", video_path,
-             "-frames:v", "1",
-             "-vf", vf,
-             "-q:v", "3",
-             out],
-            check=False
+             "-init_hw_device", "cuda=gpu",
+             "-f", "lavfi", "-i", "nullsrc=s=16x16",
+             "-frames:v", "1", "-f", "null", "-"],
+            capture_output=True, timeout=30
         )
-        if os.path.exists(out):
-            out_files.append(out)
+        return p.returncode == 0
+    except (OSError, subprocess.SubprocessError):
+        return False
 
-    return out_files, dur
+def _iter_jpegs(stream):
+    """
+    Zerlegt einen MJPEG-Stream an SOI (FFD8) / EOI (FFD9) in einzelne JPEGs.
+    """
+    buf = bytearray()
+    while True:
+        chunk = stream.read1(PIPE_BUFSIZE)
+        if not chunk:
+            return
+        buf += chunk
+        while True:
+            start = buf.find(b"\xff\xd8")
+            if start < 0:
+                break
+            end = buf.find(b"\xff\xd9", start + 2)
+            if end < 0:
+                break
+            yield bytes(buf[start:end + 2])
+            del buf[:end + 2]
+
+def _timestamps(dur: float, n: int, min_gap: float) -> list[float]:
+    if dur <= 0:
+        return [0.0]
+
+    raw_step = dur / max(n, 1)
+    step = max(min_gap, raw_step)
+    # alle i*step < dur, höchstens n Stück
+    count = min(n, math.ceil(dur / step))
+    return [i * step for i in range(count)] or [max(0.0, dur - 0.1)]
+
+def _use_input_seek(timestamps: list[float]) -> bool:
+    return len(timestamps) > 1 and timestamps[1] - timestamps[0] > SINGLE_PASS_MAX_STEP_SEC
+
+def _single_pass_cmd(src: str, timestamps: list[float], max_width: int, exact: bool) -> list[str]:
+    # Ein einziger ffmpeg-Lauf: Datei wird nur einmal demuxed/decodiert,
+    # select greift pro Timestamp den ersten Frame bei/nach t (ohne exact:
+    # den ersten Keyframe, alles dazwischen wird gar nicht erst decodiert).
+    expr = "+".join(
+        f"gte(t,{t:.3f})*(isnan(prev_selected_t)+lt(prev_selected_t,{t:.3f}))"
+        for t in timestamps
+    )
+    vf = f"select='{expr}',scale='min({max_width},iw)':-2"
+
+    return ["ffmpeg", "-hide_banner", "-loglevel", "error",
+            *_decode_args(),
+            *([] if exact else ["-skip_frame", "nokey"]),
+            "-i", src,
+            "-vf", vf,
+            "-vsync", "vfr",
+            *_JPEG_PIPE_ARGS]
+
+def _frame_to_jpeg(frame, max_width: int) -> bytes:
+    width, height = frame.width, frame.height
+    if width > max_width:
+        # wie scale='min(max_width,iw)':-2 -> Höhe gerade halten
+        height = max(2, round(height * max_width / width / 2) * 2)
+        width = max_width
+    frame = frame.reformat(width=width, height=height, format="yuvj420p")
+    frame.pts = None
+
+    # derselbe mjpeg-Encoder wie im ffmpeg-Pfad; qmin=qmax entspricht -q:v
+    enc = av.CodecContext.create("mjpeg", "w")
+    enc.width, enc.height = width, height
+    enc.pix_fmt = "yuvj420p"
+    enc.time_base = Fraction(1, 25)
+    enc.qmin = enc.qmax = JPEG_QSCALE
+    return b"".join(bytes(p) for p in enc.encode(frame) + enc.encode(None))
+
+def _open_video_av(video_path: str, exact: bool):
+    container = av.open(video_path)
+    if not container.streams.video:
+        container.close()
+        raise HTTPException(500, "Frame extraction failed: no video stream")
+    stream = container.streams.video[0]
+    stream.thread_type = "AUTO"
+    if not exact:
+        stream.codec_context.skip_frame = "NONKEY"
+    return container
+
+def _grab_frame_av(container, t: float, max_width: int,
+                   stop: threading.Event | None = None) -> tuple[int, bytes] | None:
+    """
+    Seekt zum Keyframe vor t und decodiert bis zum ersten Frame >= t - gleiche
+    Regel wie der Single-Pass: ohne exact werden nur Keyframes decodiert, also
+    der erste Keyframe bei/nach t. Gibt (pts, jpeg) zurück, None hinter dem
+    letzten (Key-)Frame oder wenn stop gesetzt ist. Fehler beim Seeken/Decodieren
+    werden nicht übersprungen, sonst passen die Frame-Nummern nicht mehr zu den
+    Timestamps.
+    """
+    stream = container.streams.video[0]
+    target = (stream.start_time or 0) + int(max(0.0, t) / stream.time_base)
+    container.seek(target, stream=stream)
+    for frame in container.decode(stream):
+        if stop is not None and stop.is_set():
+            return None
+        if frame.pts is not None and frame.pts < target:
+            continue
+        return frame.pts, _frame_to_jpeg(frame, max_width)
+    return None
+
+def _iter_jpeg_pipe(cmd: list[str], source=None):
+    """
+    Startet ffmpeg und liefert die JPEGs von stdout einzeln, sobald sie fertig
+    sind. source (optional): Iterable von Byte-Chunks, das in einem eigenen
+    Thread nach stdin geschrieben wird.
+    Wirft CalledProcessError (mit stderr) wenn ffmpeg fehlschlägt.
+    """
+    # stderr in eine Datei statt PIPE: kann nicht volllaufen, während wir stdout lesen
+    with tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if source is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=err,
+            bufsize=PIPE_BUFSIZE,
+        )
+        feed_errors = []
+
+        def feed():
+            try:
+                for chunk in source:
+                    if chunk:
+                        proc.stdin.write(chunk)
+            except BrokenPipeError:
+                pass  # ffmpeg hat aufgegeben, returncode sagt warum
+            except Exception as e:
+                feed_errors.append(e)
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+        feeder = None
+        if source is not None:
+            feeder = threading.Thread(target=feed, daemon=True)
+            feeder.start()
+        with proc:
+            try:
+                yield from _iter_jpegs(proc.stdout)
+            except BaseException:
+                # Abbruch durch den Verbraucher (z.B. Upload-Fehler): ffmpeg nicht weiterlaufen lassen
+                proc.kill()
+                raise
+            finally:
+                # stdin gehört dem Feeder (er schließt es selbst) - erst wenn er fertig
+                # ist, darf Popen.__exit__ aufräumen, sonst schreibt er in ein
+                # geschlossenes File bzw. close() wirft BrokenPipeError
+                if feeder is not None:
+                    feeder.join()
+
+        if proc.returncode != 0:
+            err.seek(0)
+            raise subprocess.CalledProcessError(
+                proc.returncode, cmd, stderr=err.read().decode("utf-8", "replace")
+            )
+    if feed_errors:
+        raise feed_errors[0]
+
+def _extraction_errors_as_http(frames):
+    """
+    Gemeinsamer Fehlervertrag für beide Wege (ffmpeg-Subprozess und PyAV):
+    jeder Fehler und auch "gar kein Frame" wird zu HTTPException(500) statt
+    stillschweigend weniger Frames zu liefern.
+    """
+    count = 0
+    try:
+        for jpg in frames:
+            count += 1
+            yield jpg
+    except subprocess.CalledProcessError as e:
+        raise HTTPException(500, f"Frame extraction failed: {(e.stderr or '').strip()}")
+    except av.error.FFmpegError as e:
+        raise HTTPException(500, f"Frame extraction failed: {e}")
+    finally:
+        # Abbruch explizit bis zur Quelle durchreichen (ffmpeg beenden, Executor stoppen)
+        close = getattr(frames, "close", None)
+        if close is not None:
+            close()
+    if count == 0:
+        raise HTTPException(500, "Frame extraction failed: no frames extracted")
+
+def _grab_frames_parallel(video_path: str, timestamps: list[float], max_width: int, exact: bool):
+    """
+    Die Seeks sind unabhängig -> parallel, jeder Worker-Thread mit eigenem
+    Container (PyAV gibt beim Decoden die GIL frei). Sliding Window: es sind
+    nie mehr als SEEK_WORKERS Timestamps in Arbeit, im RAM liegen also höchstens
+    SEEK_WORKERS + 1 fertige JPEGs, egal wie viele Frames angefragt sind.
+    Fallen mehrere Timestamps auf denselben Frame, kommt er nur einmal.
+    """
+    workers = max(1, min(SEEK_WORKERS, os.cpu_count() or 1, len(timestamps)))
+    local = threading.local()
+    stop = threading.Event()   # Fehler/Abbruch: laufende Seeks beenden sich beim nächsten Frame
+    opened = []
+    opened_lock = threading.Lock()
+
+    def grab(t):
+        if stop.is_set():
+            return None
+        container = getattr(local, "container", None)
+        if container is None:
+            container = local.container = _open_video_av(video_path, exact)
+            with opened_lock:
+                opened.append(container)
+        return _grab_frame_av(container, t, max_width, stop)
+
+    todo = iter(timestamps)
+    pending = collections.deque()
+    last_pts = None
+    ex = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for t in itertools.islice(todo, workers):
+            pending.append(ex.submit(grab, t))
+        while pending:
+            res = pending.popleft().result()
+            t = next(todo, None)
+            if t is not None:
+                pending.append(ex.submit(grab, t))
+            if res is None:
+                continue
+            pts, jpg = res
+            if pts != last_pts:
+                yield jpg
+            last_pts = pts
+    finally:
+        stop.set()
+        ex.shutdown(wait=True, cancel_futures=True)
+        for container in opened:
+            container.close()
+
+def extract_frames(video_path: str, n: int, min_gap: float, max_width: int, exact: bool = False,
+                   dur: float = 0.0):
+    """
+    Gibt (Iterator über JPEG-Bytes, Dauer) zurück; die Frames entstehen erst
+    beim Iterieren, video_path muss so lange existieren. Schlägt die Extraktion
+    fehl, wirft der Iterator HTTPException(500) - egal ob ffmpeg oder PyAV.
+    """
+    if dur <= 0:
+        dur = probe_duration(video_path)
+
+    timestamps = _timestamps(dur, n, min_gap)
+
+    if _use_input_seek(timestamps):
+        # Weit auseinander: pro Timestamp direkt zum Keyframe seeken statt die
+        # ganze Datei linear zu decodieren - in-process via PyAV, kein ffmpeg pro Frame.
+        return _extraction_errors_as_http(_grab_frames_parallel(video_path, timestamps, max_width, exact)), dur
+
+    frames = _iter_jpeg_pipe(_single_pass_cmd(video_path, timestamps, max_width, exact))
+    return _extraction_errors_as_http(frames), dur
+
+def _is_streamable(head: bytes) -> bool:
+    """
+    Prüft am ersten Chunk, ob ffmpeg das Video von einer Pipe lesen kann.
+    MP4/MOV (ISO-BMFF, ftyp-Box vorne) nur, wenn moov vor mdat kommt - bei
+    Handy-Aufnahmen steht moov oft am Ende. Andere Container (mkv, webm, ts, ...)
+    lassen sich sequentiell lesen.
+    """
+    if head[4:8] != b"ftyp":
+        return True
+
+    pos = 0
+    while pos + 8 <= len(head):
+        size = int.from_bytes(head[pos:pos + 4], "big")
+        box = head[pos + 4:pos + 8]
+        if box == b"moov":
+            return True
+        if box == b"mdat":
+            return False
+        if size == 1:  # 64-bit largesize
+            if pos + 16 > len(head):
+                return False
+            size = int.from_bytes(head[pos + 8:pos + 16], "big")
+        if size < 8:
+            return False
+        pos += size
+    # moov nicht im ersten Chunk gefunden -> sicherheitshalber über die Datei
+    return False
+
+def _stream_timestamps(dur: float, n: int, min_gap: float) -> list[float] | None:
+    # Streamen nur mit bekannter Dauer und im Single-Pass (Input-Seek braucht eine Datei)
+    if dur <= 0:
+        return None
+    timestamps = _timestamps(dur, n, min_gap)
+    return None if _use_input_seek(timestamps) else timestamps
+
+def stream_extract_frames(chunks, timestamps: list[float], max_width: int, exact: bool, file_id: str):
+    """
+    Single-Pass direkt aus dem Drive-Download (ffmpeg liest chunks von stdin),
+    Download und Decoding laufen überlappend, das Video landet nie auf Platte.
+    Gibt einen Iterator über die JPEGs zurück, oder None wenn ffmpeg vor dem
+    ersten Frame scheitert -> Aufrufer nimmt dann den Weg über die Datei.
+    """
+    frames = _iter_jpeg_pipe(_single_pass_cmd("pipe:0", timestamps, max_width, exact), source=chunks)
+    # Auf den ersten Frame warten: scheitert ffmpeg vorher, ist noch nichts
+    # hochgeladen und der Datei-Weg kann übernehmen
+    try:
+        first = next(frames, None)
+    except subprocess.CalledProcessError as e:
+        log.warning("Streaming %s failed, falling back to file: %s", file_id, (e.stderr or "").strip())
+        return None
+    except requests.RequestException as e:
+        log.warning("Streaming %s failed, falling back to file: %s", file_id, e)
+        return None
+    if first is None:
+        log.warning("Streaming %s produced no frames, falling back to file", file_id)
+        return None
+
+    return _extraction_errors_as_http(itertools.chain([first], frames))
 
 def upload_jpg(folder_id: str, filename: str, jpg_bytes: bytes) -> str:
     token = _access_token()
@@ -146,24 +602,28 @@ def upload_jpg(folder_id: str, filename: str, jpg_bytes: bytes) -> str:
 
     metadata = {"name": filename, "parents": [folder_id]}
 
-    part1 = (
+    # Body einmal in einen Puffer schreiben statt mehrfach bytes zu konkatenieren
+    body = io.BytesIO()
+    body.write((
         f"--{boundary}\r\n"
         "Content-Type: application/json; charset=UTF-8\r\n\r\n"
         f"{json.dumps(metadata)}\r\n"
-    ).encode("utf-8")
-
-    part2 = (
         f"--{boundary}\r\n"
         "Content-Type: image/jpeg\r\n\r\n"
-    ).encode("utf-8") + jpg_bytes + b"\r\n"
-
-    ending = f"--{boundary}--\r\n".encode("utf-8")
-    body = part1 + part2 + ending
+    ).encode("utf-8"))
+    body.write(jpg_bytes)
+    body.write(f"\r\n--{boundary}--\r\n".encode("utf-8"))
+    content_length = body.tell()
+    body.seek(0)
 
     url = "https://www.googleapis.com/upload/drive/v3/files?uploadType=multipart&supportsAllDrives=true"
-    r = requests.post(
+    r = SESSION.post(
         url,
-        headers={**_auth_hdr(token), "Content-Type": f"multipart/related; boundary={boundary}"},
+        headers={
+            **_auth_hdr(token),
+            "Content-Type": f"multipart/related; boundary={boundary}",
+            "Content-Length": str(content_length),
+        },
         data=body,
         timeout=60
     )
@@ -172,48 +632,140 @@ def upload_jpg(folder_id: str, filename: str, jpg_bytes: bytes) -> str:
 
     return r.json()["id"]
 
-def process_one_video(file_id: str, frames: int, min_gap_sec: float, max_width: int):
+UPLOAD_QUEUE_SIZE = 4   # max fertige JPEGs, die im RAM auf einen Upload warten
+
+def _upload_frames(file_id: str, frames) -> list[str]:
+    """
+    Producer/Consumer: JPEGs gehen direkt aus dem Iterator in eine begrenzte
+    Queue, UPLOAD_WORKERS Threads laden hoch. Ist die Queue voll, wartet der
+    Producer (ffmpeg/PyAV) -> Speicher bleibt unabhängig von der Frame-Anzahl klein.
+    Gibt die Drive-IDs in Frame-Reihenfolge zurück.
+    """
+    q = queue.Queue(maxsize=UPLOAD_QUEUE_SIZE)
+    ids = {}
+    errors = []
+
+    def worker():
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            if errors:
+                continue  # nach einem Fehler nur noch leerlaufen lassen
+            i, data = item
+            try:
+                ids[i] = upload_jpg(TARGET_FRAMES_FOLDER_ID, f"{file_id}_frame_{i:03d}.jpg", data)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(UPLOAD_WORKERS)]
+    for t in threads:
+        t.start()
+    try:
+        for i, data in enumerate(frames):
+            if errors:
+                break
+            q.put((i, data))
+    finally:
+        for _ in threads:
+            q.put(None)
+        for t in threads:
+            t.join()
+        frames.close()  # bei Abbruch ffmpeg/Download sofort beenden
+
+    if errors:
+        raise errors[0]
+    return [ids[i] for i in sorted(ids)]
+
+def process_one_video(file_id: str, frames: int, min_gap_sec: float, max_width: int, exact: bool = False,
+                      duration: float | None = None):
     """
     Lädt ein Video runter, extrahiert Frames, lädt Frames in TARGET_FRAMES_FOLDER_ID hoch.
+    duration: bereits bekannte Dauer (z.B. aus dem Batch-Metadaten-Call), sonst von Drive geholt.
     Gibt Ergebnis zurück (oder wirft Exception).
     """
+    if duration is None:
+        duration = drive_video_duration(file_id)
+
+    # Erst direkt aus dem Download-Stream, sonst klassisch über eine tmpfs-Datei.
+    # Frames werden hochgeladen, sobald sie aus ffmpeg/PyAV kommen.
+    dur = duration
+    ids = None
     with tempfile.TemporaryDirectory() as td:
         video_path = os.path.join(td, "video.mp4")
-        frames_dir = os.path.join(td, "frames")
-        os.makedirs(frames_dir, exist_ok=True)
-
-        download_drive_video(file_id, video_path)
+        downloaded = False
 
-        frame_files, dur = extract_frames(
-            video_path,
-            frames_dir,
-            frames,
-            min_gap_sec,
-            max_width,
-        )
+        with _open_drive_media(file_id) as r:
+            chunks = r.iter_content(chunk_size=1024 * 1024)
+            head = next(chunks, b"")
+            timestamps = _stream_timestamps(duration, frames, min_gap_sec)
 
-        ids = []
-        for i, fp in enumerate(frame_files):
-            with open(fp, "rb") as f:
-                ids.append(
-                    upload_jpg(
-                        TARGET_FRAMES_FOLDER_ID,
-                        f"{file_id}_frame_{i:03d}.jpg",
-                        f.read(),
-                    )
+            if timestamps is not None and _is_streamable(head):
+                frame_iter = stream_extract_frames(
+                    itertools.chain([head], chunks), timestamps, max_width, exact, file_id
                 )
+                if frame_iter is not None:
+                    ids = _upload_frames(file_id, frame_iter)
+            else:
+                # Nicht streambar: denselben Download einfach auf Platte schreiben
+                _write_chunks(itertools.chain([head], chunks), video_path)
+                downloaded = True
+
+        if ids is None:
+            if not downloaded:
+                # nur wenn der Stream unerwartet gescheitert ist
+                download_drive_video(file_id, video_path)
+
+            frame_iter, dur = extract_frames(
+                video_path,
+                frames,
+                min_gap_sec,
+                max_width,
+                exact,
+                duration,
+            )
+            ids = _upload_frames(file_id, frame_iter)
 
-        return {
-            "videoId": file_id,
-            "durationSec": dur,
-            "frameFileIds": ids,
-            "savedToFolderId": TARGET_FRAMES_FOLDER_ID,
-        }
+    return {
+        "videoId": file_id,
+        "durationSec": dur,
+        # Mehrere Timestamps können auf denselben (Key-)Frame fallen, der dann
+        # nur einmal gespeichert wird -> frameFileIds kann kürzer sein
+        "requestedFrames": len(_timestamps(dur, frames, min_gap_sec)),
+        "frameFileIds": ids,
+        "savedToFolderId": TARGET_FRAMES_FOLDER_ID,
+    }
+
+@app.on_event("startup")
+def warm_up():
+    """
+    Cold-Start vorziehen: ffmpeg/ffprobe einmal ausführen (Binary + Libs im
+    Page-Cache), hwaccel-Erkennung cachen, Token holen und TLS zu googleapis
+    aufbauen - damit der erste echte Request das nicht bezahlt.
+    Fehler hier sind egal, der Request-Pfad macht es sonst selbst.
+    """
+    for cmd in (["ffmpeg", "-version"], ["ffprobe", "-version"]):
+        try:
+            subprocess.run(cmd, capture_output=True, timeout=30)
+        except (OSError, subprocess.SubprocessError):
+            pass
+    _decode_args()
+
+    try:
+        token = _access_token()
+        SESSION.get(
+            "https://www.googleapis.com/drive/v3/about",
+            headers=_auth_hdr(token),
+            params={"fields": "user"},
+            timeout=10,
+        )
+    except requests.RequestException:
+        pass
 
 @app.post("/extract-and-save")
 def extract_and_save(req: ExtractReq):
     # Single = einfach den Worker nutzen
-    return process_one_video(req.fileId, req.frames, req.min_gap_sec, req.max_width)
+    return process_one_video(req.fileId, req.frames, req.min_gap_sec, req.max_width, req.exact)
 
 
 # ======================================================================
@@ -225,20 +777,46 @@ class BatchReq(BaseModel):
     frames: int = 20
     min_gap_sec: float = 2.0
     max_width: int = 640
+    exact: bool = False
 
 @app.post("/extract-batch")
 def extract_batch(req: BatchReq):
     # Sicherheitslimits
     file_ids = (req.fileIds or [])[:50]        # max 50 pro Request
-    workers = max(1, min(int(req.concurrency), 10))  # max 10 parallel
+    workers = max(1, min(int(req.concurrency), MAX_BATCH_CONCURRENCY))
 
     results = []
     errors = []
 
+    # Metadaten aller Videos in einem Batch-Call vorab prüfen, statt dass
+    # jeder Worker erst beim Download auf ein 404 läuft. Klappt der Batch-Call
+    # nicht, holt sich jeder Worker die Metadaten selbst (duration=None).
+    try:
+        meta = drive_batch([
+            f"/drive/v3/files/{quote(fid, safe='')}?fields=mimeType,{DRIVE_DURATION_FIELDS}&supportsAllDrives=true"
+            for fid in file_ids
+        ])
+    except (HTTPException, requests.RequestException):
+        meta = [(0, {})] * len(file_ids)
+
+    todo = []   # (fileId, duration) - Duplikate bleiben drin, wie angefragt
+    for fid, (status, data) in zip(file_ids, meta):
+        if status == 0:
+            todo.append((fid, None))
+        elif status >= 300:
+            msg = (data.get("error") or {}).get("message") or f"Drive metadata lookup failed ({status})"
+            errors.append({"videoId": fid, "error": msg})
+        elif data.get("mimeType", "").startswith("application/vnd.google-apps."):
+            # Ordner/Docs haben keinen Inhalt für alt=media - scheitern auch bei /extract-and-save;
+            # alles andere (auch application/octet-stream) darf ffmpeg versuchen
+            errors.append({"videoId": fid, "error": f"Not a media file (mimeType {data['mimeType']})"})
+        else:
+            todo.append((fid, _meta_duration(data)))
+
     with ThreadPoolExecutor(max_workers=workers) as ex:
         futures = {
-            ex.submit(process_one_video, fid, req.frames, req.min_gap_sec, req.max_width): fid
-            for fid in file_ids
+            ex.submit(process_one_video, fid, req.frames, req.min_gap_sec, req.max_width, req.exact, dur): fid
+            for fid, dur in todo
         }
         for fut in as_completed(futures):
             fid = futures[fut]